@@ -0,0 +1,342 @@
+# Офлайн-бенчмарк бота: подменяет Telegram API локальной заглушкой,
+# проигрывает сценарии обновлений во временном репозитории и замеряет
+# горячие пути (front matter, оптимизация изображений, сохранение, список новостей).
+#
+#   python benchmark.py --output bench.json
+#   python benchmark.py --compare bench.json --threshold 0.2
+#   python benchmark.py --replay recorded_updates.jsonl
+import sys
+import copy
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import platform
+import statistics
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+from telebot import apihelper
+from telebot.types import Update
+
+import privseobot
+
+LISTING_SIZES = (10, 1000, 10000)
+CHAT_ID = 1000
+BENCH_TOKEN = "0:benchmark"
+BENCH_USER_ID = 1
+
+SAMPLE_POST = """---
+layout: news
+news_id: 0123456789abcdef
+name: "Тестовая новость"
+title: "Тестовая новость для бенчмарка"
+description: "Описание тестовой новости"
+date: 2025-07-24
+image: "/assets/images/news/20250724_105118.webp"
+category: seo
+---
+
+""" + "Текст новости с <b>разметкой</b> и **markdown**.\n\n" * 40
+
+SAMPLE_MENU = """items:
+- title: Главная
+  url: /
+- title: Новости
+  url: /news/
+"""
+
+# --- ЗАГЛУШКА TELEGRAM API ---
+class FakeTelegramApi:
+    def __init__(self):
+        self.calls = []
+        self.files = {}
+        self.error_replies = []
+        self.message_id = 0
+
+    def _message(self, params):
+        self.message_id += 1
+        return {
+            "message_id": params.get("message_id", self.message_id),
+            "date": int(time.time()),
+            "chat": {"id": params.get("chat_id", CHAT_ID), "type": "private"},
+            "text": params.get("text", "")
+        }
+
+    def make_request(self, token, method_name, method='get', params=None, files=None):
+        params = params or {}
+        self.calls.append(method_name)
+        if method_name in ("sendMessage", "editMessageText"):
+            if str(params.get("text", "")).startswith("❌"):
+                self.error_replies.append(params["text"])
+            return self._message(params)
+        if method_name == "getFile":
+            file_id = params["file_id"]
+            return {"file_id": file_id, "file_unique_id": file_id, "file_path": file_id}
+        if method_name == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "benchmark", "username": "benchmark_bot"}
+        return True
+
+    def download_file(self, token, file_path):
+        # В записанных обновлениях file_id настоящие: отдаем тестовое фото
+        return self.files.get(file_path, self.files["photo"])
+
+    def install(self):
+        apihelper._make_request = self.make_request
+        apihelper.download_file = self.download_file
+
+def make_photo(width=1280, height=853):
+    red = Image.linear_gradient('L').resize((width, height))
+    green = Image.radial_gradient('L').resize((width, height))
+    blue = red.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+    output = BytesIO()
+    Image.merge('RGB', (red, green, blue)).save(output, format='JPEG', quality=90)
+    return output.getvalue()
+
+# --- СЦЕНАРИИ ---
+SCENARIOS = {
+    "add_news_with_photo": [
+        {"type": "message", "text": "/news"},
+        {"type": "callback", "data": "add_news"},
+        {"type": "message", "text": privseobot.CATEGORIES["seo"]},
+        {"type": "message", "text": "Новость из бенчмарка"},
+        {"type": "message", "text": "Новость из бенчмарка — title"},
+        {"type": "message", "text": "Описание новости"},
+        {"type": "photo", "file": "photo"},
+        {"type": "message", "text": "Основной текст новости"}
+    ],
+    "edit_news_fields": [
+        {"type": "callback", "data": "edit_news"},
+        {"type": "callback", "data": "edit_news_select_0"},
+        {"type": "callback", "data": "edit_field_title"},
+        {"type": "message", "text": "Новый title"},
+        {"type": "callback", "data": "edit_news_select_0"},
+        {"type": "callback", "data": "edit_field_image"},
+        {"type": "photo", "file": "photo"},
+        {"type": "callback", "data": "edit_news_select_0"},
+        {"type": "callback", "data": "edit_field_content"},
+        {"type": "message", "text": "Новый контент"}
+    ],
+    "delete_news": [
+        {"type": "callback", "data": "delete_news"},
+        {"type": "callback", "data": "delete_news_confirm_0"},
+        {"type": "callback", "data": "delete_news_execute_0"}
+    ],
+    "menu_edits": [
+        {"type": "message", "text": "/menu"},
+        {"type": "callback", "data": "show_menu"},
+        {"type": "callback", "data": "add_item"},
+        {"type": "message", "text": "Контакты"},
+        {"type": "message", "text": "/contacts/"},
+        {"type": "callback", "data": "edit_item"},
+        {"type": "callback", "data": "edit_select_0"},
+        {"type": "message", "text": "/skip"},
+        {"type": "message", "text": "/index/"},
+        {"type": "callback", "data": "delete_item"},
+        {"type": "callback", "data": "delete_confirm_2"},
+        {"type": "callback", "data": "delete_execute_2"}
+    ]
+}
+
+def build_update(update_id, step):
+    if "update_id" in step:
+        # Записанные обновления проигрываются от имени авторизованного пользователя
+        step = copy.deepcopy(step)
+        for key in ("message", "callback_query"):
+            if "from" in step.get(key, {}):
+                step[key]["from"]["id"] = BENCH_USER_ID
+        return Update.de_json(step)
+    user = {"id": BENCH_USER_ID, "is_bot": False, "first_name": "bench"}
+    chat = {"id": CHAT_ID, "type": "private"}
+    message = {"message_id": update_id, "date": int(time.time()), "chat": chat, "from": user}
+    if step["type"] == "callback":
+        return Update.de_json({
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": user,
+                "chat_instance": str(CHAT_ID),
+                "data": step["data"],
+                "message": dict(message, text="menu")
+            }
+        })
+    if step["type"] == "photo":
+        file_id = step["file"]
+        message["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 853}]
+    else:
+        message["text"] = step["text"]
+    return Update.de_json({"update_id": update_id, "message": message})
+
+# --- ЗАПУСК ---
+class Benchmark:
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = {}
+        self.failures = {}
+        self.api = FakeTelegramApi()
+        self.api.install()
+        self.api.files["photo"] = make_photo()
+        # load_settings() не вызываем: .env мог бы включить запись в боевой METRICS_TRACE_PATH
+        privseobot.AUTHORIZED_USER_ID = BENCH_USER_ID
+        bot = privseobot.create_bot(BENCH_TOKEN)
+        bot.threaded = False
+        privseobot.outbox = privseobot.OutboundQueue(bot, global_rate=None, chat_rate=None)
+
+    def make_repo(self, posts=1):
+        repo = Path(tempfile.mkdtemp(prefix="privseo_bench_"))
+        (repo / privseobot.NEWS_DIR).mkdir(parents=True)
+        (repo / privseobot.MENU_PATH).parent.mkdir(parents=True)
+        (repo / privseobot.MENU_PATH).write_text(SAMPLE_MENU, encoding='utf-8')
+        for i in range(posts):
+            (repo / privseobot.NEWS_DIR / f"2025-07-24-news-{i:05d}.md").write_text(SAMPLE_POST, encoding='utf-8')
+        privseobot.LOCAL_REPO_PATH = repo
+        privseobot.user_states.clear()
+        return repo
+
+    def record(self, name, samples):
+        samples = sorted(samples)
+        self.results[name] = {
+            "runs": len(samples),
+            "min_ms": round(samples[0] * 1000, 3),
+            "median_ms": round(statistics.median(samples) * 1000, 3),
+            "p95_ms": round(samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))] * 1000, 3)
+        }
+
+    def measure(self, name, func):
+        # Прогрев: ленивые импорты PIL/yaml не должны попадать в замер
+        func()
+        samples = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+        self.record(name, samples)
+
+    def replay(self, name, steps):
+        # Сценарий, закончившийся ошибкой, нельзя сравнивать по времени
+        for update_id, step in enumerate(steps, 1):
+            try:
+                privseobot.bot.process_new_updates([build_update(update_id, step)])
+            except Exception as e:
+                self.failures.setdefault(name, []).append(f"шаг {update_id}: {type(e).__name__}: {e}")
+            privseobot.outbox.flush()
+            for text in self.api.error_replies:
+                self.failures.setdefault(name, []).append(f"шаг {update_id}: {text}")
+            self.api.error_replies.clear()
+
+    def run_replay(self, name, steps, posts=1):
+        samples = []
+        privseobot.metrics = privseobot.Metrics()
+        for _ in range(self.repeat):
+            repo = self.make_repo(posts)
+            try:
+                start = time.perf_counter()
+                self.replay(f"replay.{name}", steps)
+                samples.append(time.perf_counter() - start)
+            finally:
+                shutil.rmtree(repo, ignore_errors=True)
+        self.record(f"replay.{name}", samples)
+        for op_name, op in privseobot.metrics.ops.items():
+            if not op_name.startswith("handler."):
+                self.record(f"replay.{name}.{op_name}", list(op["samples"]))
+
+    def run_stages(self):
+        self.measure("stage.front_matter_parse", lambda: privseobot.parse_front_matter(SAMPLE_POST))
+
+        photo = self.api.files["photo"]
+        self.measure("stage.image_optimize", lambda: privseobot.optimize_image(photo))
+
+        optimized, _ = privseobot.optimize_image(photo)
+        repo = self.make_repo(posts=0)
+        try:
+            self.measure("stage.file_save", lambda: (
+                privseobot.save_image(optimized, "bench.webp"),
+                privseobot.save_news_file("bench.md", SAMPLE_POST)
+            ))
+        finally:
+            shutil.rmtree(repo, ignore_errors=True)
+
+        listing = [{"type": "callback", "data": "list_news"}]
+        for size in LISTING_SIZES:
+            repo = self.make_repo(posts=size)
+            try:
+                self.measure(f"stage.listing_{size}", lambda: self.replay(f"stage.listing_{size}", listing))
+            finally:
+                shutil.rmtree(repo, ignore_errors=True)
+
+    def run_scenarios(self, scenarios):
+        for name, steps in scenarios.items():
+            self.run_replay(name, steps)
+
+def load_replay(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return {Path(path).stem: [json.loads(line) for line in f if line.strip()]}
+
+def compare(results, baseline, threshold, min_delta_ms):
+    regressions = []
+    print(f"{'операция':<50} {'было, мс':>10} {'стало, мс':>10} {'изм.':>8}")
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["median_ms"], result["median_ms"]
+        change = (after - before) / before if before else 0.0
+        mark = " ⚠️" if change > threshold and after - before > min_delta_ms else ""
+        print(f"{name:<50} {before:>10.3f} {after:>10.3f} {change:>+8.1%}{mark}")
+        if mark:
+            regressions.append(name)
+    return regressions
+
+def print_results(results):
+    print(f"{'операция':<50} {'min, мс':>10} {'median, мс':>11} {'p95, мс':>10}")
+    for name, result in sorted(results.items()):
+        print(f"{name:<50} {result['min_ms']:>10.3f} {result['median_ms']:>11.3f} {result['p95_ms']:>10.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк Telegram-бота")
+    parser.add_argument("--repeat", type=int, default=5, help="Количество повторов каждого замера")
+    parser.add_argument("--output", help="Сохранить результаты в JSON")
+    parser.add_argument("--compare", help="Сравнить с ранее сохраненными результатами")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Допустимый рост медианы (0.2 = 20%%)")
+    parser.add_argument("--min-delta", type=float, default=0.5, help="Минимальный рост медианы в мс, считающийся регрессией")
+    parser.add_argument("--replay", action="append", default=[], help="JSONL-файл с записанными обновлениями")
+    parser.add_argument("--skip-stages", action="store_true", help="Только сценарии, без замеров этапов")
+    args = parser.parse_args()
+
+    benchmark = Benchmark(args.repeat)
+    if not args.skip_stages:
+        benchmark.run_stages()
+    scenarios = dict(SCENARIOS)
+    for path in args.replay:
+        scenarios.update(load_replay(path))
+    benchmark.run_scenarios(scenarios)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat
+        },
+        "results": benchmark.results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(benchmark.results, json.load(f)["results"], args.threshold, args.min_delta)
+        if regressions:
+            print(f"\n❌ Регрессии: {', '.join(regressions)}")
+    else:
+        print_results(benchmark.results)
+
+    for name, errors in sorted(benchmark.failures.items()):
+        print(f"\n❌ {name}: {len(errors)} ошибок")
+        for error in errors[:5]:
+            print(f"   {error}")
+    if regressions or benchmark.failures:
+        sys.exit(1)
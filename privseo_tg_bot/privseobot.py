@@ -1,27 +1,56 @@
-import telebot
-from telebot.types import (Message, ReplyKeyboardMarkup, 
-                          ReplyKeyboardRemove, InlineKeyboardMarkup, 
-                          InlineKeyboardButton)
+import time
+
+START_TIME = time.perf_counter()
+
 from datetime import datetime
 import re
 from io import BytesIO
-from PIL import Image
-import yaml
-from dotenv import load_dotenv
 import os
+import sys
 import uuid
+import base64
+import argparse
+import json
+import bisect
+import threading
+import signal
+import functools
+import shutil
+import tempfile
+from collections import deque, OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
 
-# Загрузка переменных окружения из .env файла
-load_dotenv()
+# telebot и yaml импортируются при первом использовании: режимам командной строки
+# (backfill-images, import, export) и бенчмарку telebot не нужен, а yaml нужен только
+# операциям с новостями и меню. В режиме бота заметного выигрыша нет: telebot (~100 мс)
+# сам импортирует PIL через telebot/service_utils.py, откладывается только yaml (~15-20 мс).
+# Ленивый импорт PIL и telebot ускоряет режимы командной строки (~25 мс против ~125 мс).
 
 # --- НАСТРОЙКИ ---
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-AUTHORIZED_USER_ID = int(os.getenv("AUTHORIZED_USER_ID"))
-LOCAL_REPO_PATH = Path(os.getenv("LOCAL_REPO_PATH", "D:/privateseo.github.io"))
+BOT_TOKEN = None
+AUTHORIZED_USER_ID = None
+LOCAL_REPO_PATH = Path("D:/privateseo.github.io")
 NEWS_DIR = "_posts/news"
 IMAGES_DIR = "assets/images/news"
 MENU_PATH = "_data/menu.yml"
+PLACEHOLDER_SIZE = 16
+IMAGE_META_FIELDS = ("image_width", "image_height", "image_color", "image_placeholder")
+IMPORT_FIELDS = ("file", "name", "title", "description", "category", "date", "image", "news_id")
+IMPORT_FILENAME_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}-[\w.-]+\.md')
+IMPORT_DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}([ T]\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?( ?(Z|[+-]\d{2}:?\d{2}))?)?')
+METRICS_PORT = None
+# /metrics без авторизации, поэтому по умолчанию доступен только локально
+METRICS_HOST = "127.0.0.1"
+METRICS_TRACE_PATH = None
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_SAMPLE_SIZE = 1000
+# Лимиты Telegram: ~30 сообщений в секунду всего и ~1 в секунду в один чат
+OUTBOX_GLOBAL_RATE = 30
+OUTBOX_CHAT_RATE = 1
+OUTBOX_CHAT_BURST = 3
+OUTBOX_MAX_RETRIES = 5
+OUTBOX_SHUTDOWN_TIMEOUT = 10
 
 # --- КАТЕГОРИИ ---
 CATEGORIES = {
@@ -41,14 +70,321 @@ TRANSLIT_TABLE = {
     'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya'
 }
 
-bot = telebot.TeleBot(BOT_TOKEN)
+# --- МЕТРИКИ ---
+class Metrics:
+    def __init__(self, trace_path=None):
+        self.lock = threading.Lock()
+        self.ops = {}
+        self.trace_file = None
+        if trace_path:
+            self.open_trace(trace_path)
+
+    def open_trace(self, trace_path):
+        self.trace_file = open(trace_path, 'a', encoding='utf-8')
+
+    def _get_op(self, name):
+        if name not in self.ops:
+            self.ops[name] = {
+                "count": 0,
+                "errors": 0,
+                "bytes": 0,
+                "sum": 0.0,
+                "buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+                "samples": deque(maxlen=METRICS_SAMPLE_SIZE)
+            }
+        return self.ops[name]
+
+    def observe(self, name, seconds, nbytes=0, error=False):
+        with self.lock:
+            op = self._get_op(name)
+            op["count"] += 1
+            op["errors"] += int(error)
+            op["bytes"] += nbytes
+            op["sum"] += seconds
+            op["buckets"][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            op["samples"].append(seconds)
+            if self.trace_file:
+                self.trace_file.write(json.dumps({
+                    "ts": round(time.time(), 3),
+                    "op": name,
+                    "ms": round(seconds * 1000, 3),
+                    "bytes": nbytes,
+                    "error": error
+                }) + "\n")
+                self.trace_file.flush()
+
+    def percentile(self, name, q):
+        with self.lock:
+            samples = sorted(self.ops[name]["samples"])
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(round(q * (len(samples) - 1))))]
+
+    def summary(self):
+        with self.lock:
+            names = sorted(self.ops)
+        if not names:
+            return "📊 Пока нет данных"
+        text = "📊 Статистика операций (p50 / p95, мс):\n\n"
+        for name in names:
+            op = self.ops[name]
+            text += (f"{name}: {self.percentile(name, 0.5) * 1000:.1f} / {self.percentile(name, 0.95) * 1000:.1f}"
+                     f" ({op['count']} шт., ошибок: {op['errors']}")
+            if op["bytes"]:
+                text += f", {op['bytes'] / 1024:.0f} КБ"
+            text += ")\n"
+        return text
+
+    def prometheus(self):
+        lines = [
+            "# HELP privseo_op_duration_seconds Длительность операций бота",
+            "# TYPE privseo_op_duration_seconds histogram"
+        ]
+        with self.lock:
+            ops = {name: {**op, "buckets": list(op["buckets"])} for name, op in self.ops.items()}
+        for name, op in sorted(ops.items()):
+            cumulative = 0
+            for le, count in zip(LATENCY_BUCKETS, op["buckets"]):
+                cumulative += count
+                lines.append(f'privseo_op_duration_seconds_bucket{{op="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'privseo_op_duration_seconds_bucket{{op="{name}",le="+Inf"}} {op["count"]}')
+            lines.append(f'privseo_op_duration_seconds_sum{{op="{name}"}} {op["sum"]}')
+            lines.append(f'privseo_op_duration_seconds_count{{op="{name}"}} {op["count"]}')
+        lines += ["# HELP privseo_op_bytes_total Объем данных, обработанных операцией",
+                  "# TYPE privseo_op_bytes_total counter"]
+        lines += [f'privseo_op_bytes_total{{op="{name}"}} {op["bytes"]}' for name, op in sorted(ops.items())]
+        lines += ["# HELP privseo_op_errors_total Количество ошибок операции",
+                  "# TYPE privseo_op_errors_total counter"]
+        lines += [f'privseo_op_errors_total{{op="{name}"}} {op["errors"]}' for name, op in sorted(ops.items())]
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+active_spans = threading.local()
+
+@contextmanager
+def track(name, nbytes=0):
+    span = {"bytes": nbytes, "error": False}
+    stack = active_spans.__dict__.setdefault("stack", [])
+    stack.append(span)
+    start = time.perf_counter()
+    try:
+        yield span
+    except BaseException:
+        span["error"] = True
+        raise
+    finally:
+        stack.pop()
+        metrics.observe(name, time.perf_counter() - start, span["bytes"], error=span["error"])
+
+def mark_error():
+    # Обработчики сами ловят исключения, поэтому ошибка отмечается
+    # у внешней операции текущего потока (обычно handler.*)
+    stack = getattr(active_spans, "stack", None)
+    if stack:
+        stack[0]["error"] = True
+
+def timed(name=None):
+    def decorator(func):
+        op_name = name or f"handler.{func.__name__}"
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track(op_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def start_metrics_server(port, host=None):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host or METRICS_HOST, int(port)), MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# --- ИСХОДЯЩИЕ СООБЩЕНИЯ ---
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def wait_time(self, now):
+        if not self.rate:
+            return 0.0
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        if self.rate:
+            self.tokens -= 1
+
+class OutboundQueue:
+    def __init__(self, bot, global_rate=OUTBOX_GLOBAL_RATE, chat_rate=OUTBOX_CHAT_RATE, chat_burst=OUTBOX_CHAT_BURST):
+        self.bot = bot
+        self.condition = threading.Condition()
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets = {}
+        # chat_id -> очередь вызовов; порядок внутри чата сохраняется
+        self.pending = OrderedDict()
+        # Ключ -> еще не отправленный вызов, который можно заменить более свежим
+        self.coalesced = {}
+        self.paused_until = 0.0
+        self.in_flight = 0
+        self.worker = None
+
+    def send_message(self, chat_id, text, **kwargs):
+        self._put(chat_id, "send_message", (chat_id, text), kwargs)
+
+    def reply_to(self, message, text, **kwargs):
+        self.send_message(message.chat.id, text, reply_to_message_id=message.message_id, **kwargs)
+
+    def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        self._put(chat_id, "edit_message_text", (text, chat_id, message_id), kwargs,
+                  key=("edit_message_text", chat_id, message_id))
+
+    def send_chat_action(self, chat_id, action):
+        self._put(chat_id, "send_chat_action", (chat_id, action), {}, key=("send_chat_action", chat_id, action))
+
+    def flush(self, timeout=None):
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.pending and not self.in_flight, timeout)
+
+    def _put(self, chat_id, method, args, kwargs, key=None):
+        with self.condition:
+            if key is not None and key in self.coalesced:
+                self.coalesced[key].update(args=args, kwargs=kwargs)
+                return
+            call = {"method": method, "args": args, "kwargs": kwargs, "key": key, "attempts": 0}
+            self.pending.setdefault(chat_id, deque()).append(call)
+            if key is not None:
+                self.coalesced[key] = call
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._run, daemon=True)
+                self.worker.start()
+            self.condition.notify_all()
+
+    def _chat_bucket(self, chat_id):
+        if chat_id not in self.chat_buckets:
+            self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return self.chat_buckets[chat_id]
+
+    def _next_chat(self, now):
+        if now < self.paused_until:
+            return None, self.paused_until - now
+        wait = self.global_bucket.wait_time(now)
+        if wait:
+            return None, wait
+        for chat_id in self.pending:
+            chat_wait = self._chat_bucket(chat_id).wait_time(now)
+            if not chat_wait:
+                return chat_id, 0.0
+            wait = chat_wait if not wait else min(wait, chat_wait)
+        return None, wait
+
+    def _take(self):
+        with self.condition:
+            while True:
+                if not self.pending:
+                    self.condition.wait()
+                    continue
+                chat_id, wait = self._next_chat(time.monotonic())
+                if chat_id is not None:
+                    break
+                self.condition.wait(wait)
+            calls = self.pending[chat_id]
+            call = calls.popleft()
+            if calls:
+                self.pending.move_to_end(chat_id)
+            else:
+                del self.pending[chat_id]
+            if call["key"] is not None:
+                self.coalesced.pop(call["key"], None)
+            self.global_bucket.take()
+            self._chat_bucket(chat_id).take()
+            self.in_flight += 1
+            return chat_id, call
+
+    def _retry(self, chat_id, call, retry_after):
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            if call["key"] is not None:
+                if call["key"] in self.coalesced:
+                    # Пока ждали, в очередь уже встал более свежий вызов
+                    return
+                self.coalesced[call["key"]] = call
+            self.pending.setdefault(chat_id, deque()).appendleft(call)
+            self.pending.move_to_end(chat_id, last=False)
+
+    def _run(self):
+        from telebot.apihelper import ApiTelegramException
+
+        while True:
+            chat_id, call = self._take()
+            try:
+                with track(f"tg.{call['method']}"):
+                    getattr(self.bot, call["method"])(*call["args"], **call["kwargs"])
+            except ApiTelegramException as e:
+                call["attempts"] += 1
+                if e.error_code == 429 and call["attempts"] < OUTBOX_MAX_RETRIES:
+                    self._retry(chat_id, call, e.result_json.get("parameters", {}).get("retry_after", 1))
+                else:
+                    print(f"Error calling {call['method']}: {e}")
+            except Exception as e:
+                print(f"Error calling {call['method']}: {e}")
+            finally:
+                with self.condition:
+                    self.in_flight -= 1
+                    self.condition.notify_all()
+
+bot = None
+outbox = None
 user_states = {}
 
+def load_settings():
+    global BOT_TOKEN, AUTHORIZED_USER_ID, LOCAL_REPO_PATH, METRICS_PORT, METRICS_HOST, METRICS_TRACE_PATH
+    from dotenv import load_dotenv
+
+    # Загрузка переменных окружения из .env файла
+    load_dotenv()
+    BOT_TOKEN = os.getenv("BOT_TOKEN")
+    if os.getenv("AUTHORIZED_USER_ID"):
+        AUTHORIZED_USER_ID = int(os.getenv("AUTHORIZED_USER_ID"))
+    LOCAL_REPO_PATH = Path(os.getenv("LOCAL_REPO_PATH", str(LOCAL_REPO_PATH)))
+    METRICS_PORT = os.getenv("METRICS_PORT")
+    METRICS_HOST = os.getenv("METRICS_HOST", METRICS_HOST)
+    METRICS_TRACE_PATH = os.getenv("METRICS_TRACE_PATH")
+    if METRICS_TRACE_PATH:
+        metrics.open_trace(METRICS_TRACE_PATH)
+
 # --- ОБЩИЕ ФУНКЦИИ ---
+def reply_error(chat_id, text, **kwargs):
+    mark_error()
+    outbox.send_message(chat_id, text, **kwargs)
+
 def is_authorized(user_id):
     return user_id == AUTHORIZED_USER_ID
 
 def get_menu_data():
+    import yaml
     menu_path = LOCAL_REPO_PATH / MENU_PATH
     try:
         with open(menu_path, 'r', encoding='utf-8') as f:
@@ -58,9 +394,10 @@ def get_menu_data():
         return {"items": []}
 
 def update_menu_data(data):
+    import yaml
     menu_path = LOCAL_REPO_PATH / MENU_PATH
     try:
-        with open(menu_path, 'w', encoding='utf-8') as f:
+        with track("update_menu_data"), open(menu_path, 'w', encoding='utf-8') as f:
             yaml.dump(data, f, allow_unicode=True, sort_keys=False)
         return True
     except Exception as e:
@@ -86,9 +423,10 @@ def get_news_file_content(path):
 def save_news_file(filename, content):
     news_path = LOCAL_REPO_PATH / NEWS_DIR / filename
     try:
-        news_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(news_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        with track("save_news_file", len(content.encode('utf-8'))):
+            news_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(news_path, 'w', encoding='utf-8') as f:
+                f.write(content)
         return {"success": True, "path": str(news_path)}
     except Exception as e:
         print(f"Error saving news file: {e}")
@@ -97,10 +435,11 @@ def save_news_file(filename, content):
 def save_image(image_bytes, filename):
     images_dir = LOCAL_REPO_PATH / IMAGES_DIR
     try:
-        images_dir.mkdir(parents=True, exist_ok=True)
-        image_path = images_dir / filename
-        with open(image_path, 'wb') as f:
-            f.write(image_bytes)
+        with track("save_image", len(image_bytes)):
+            images_dir.mkdir(parents=True, exist_ok=True)
+            image_path = images_dir / filename
+            with open(image_path, 'wb') as f:
+                f.write(image_bytes)
         return str(image_path.relative_to(LOCAL_REPO_PATH))
     except Exception as e:
         print(f"Error saving image: {e}")
@@ -117,7 +456,16 @@ def delete_news_file(filename):
         print(f"Error deleting news file: {e}")
         return False
 
+def download_photo(file_id):
+    with track("tg.get_file"):
+        file_info = bot.get_file(file_id)
+    with track("tg.download_file") as span:
+        image_bytes = bot.download_file(file_info.file_path)
+        span["bytes"] = len(image_bytes)
+    return image_bytes
+
 def menu_keyboard():
+    from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
     markup = InlineKeyboardMarkup()
     markup.row(
         InlineKeyboardButton("📋 Показать меню", callback_data="show_menu"),
@@ -130,6 +478,7 @@ def menu_keyboard():
     return markup
 
 def news_management_keyboard():
+    from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
     markup = InlineKeyboardMarkup()
     markup.row(
         InlineKeyboardButton("📝 Добавить новость", callback_data="add_news"),
@@ -142,6 +491,7 @@ def news_management_keyboard():
     return markup
 
 def category_keyboard():
+    from telebot.types import ReplyKeyboardMarkup
     markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
     for cat in CATEGORIES.values():
         markup.add(cat)
@@ -159,20 +509,64 @@ def transliterate(text):
             result.append('-')
     return ''.join(result)
 
+def get_dominant_color(thumb):
+    palette_img = thumb.quantize(colors=8)
+    count, index = max(palette_img.getcolors())
+    r, g, b = palette_img.getpalette()[index * 3:index * 3 + 3]
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+def get_image_placeholder(thumb, size=PLACEHOLDER_SIZE):
+    thumb = thumb.copy()
+    thumb.thumbnail((size, size))
+    output = BytesIO()
+    thumb.save(output, format='WEBP', quality=30)
+    encoded = base64.b64encode(output.getvalue()).decode('ascii')
+    return f"data:image/webp;base64,{encoded}"
+
+def get_image_meta(img):
+    from PIL import Image
+    width, height = img.size
+    # Одна маленькая копия для цвета и превью вместо полноразмерных convert()
+    ratio = min(64 / width, 64 / height, 1)
+    thumb_size = (max(1, round(width * ratio)), max(1, round(height * ratio)))
+    thumb = img.resize(thumb_size, Image.Resampling.LANCZOS, reducing_gap=2.0).convert('RGB')
+    return {
+        "image_width": width,
+        "image_height": height,
+        "image_color": get_dominant_color(thumb),
+        "image_placeholder": get_image_placeholder(thumb)
+    }
+
 def optimize_image(image_bytes, quality=80):
+    from PIL import Image
     try:
-        img = Image.open(BytesIO(image_bytes))
-        if img.mode in ('RGBA', 'P'):
-            img = img.convert('RGB')
-        output = BytesIO()
-        img.save(output, format='WEBP', quality=quality, method=6)
-        optimized_bytes = output.getvalue()
-        output.close()
-        return optimized_bytes
+        with track("optimize_image") as span:
+            img = Image.open(BytesIO(image_bytes))
+            if img.mode in ('RGBA', 'P'):
+                img = img.convert('RGB')
+            output = BytesIO()
+            img.save(output, format='WEBP', quality=quality, method=6)
+            optimized_bytes = output.getvalue()
+            output.close()
+            span["bytes"] = len(optimized_bytes)
+            return optimized_bytes, get_image_meta(img)
     except Exception as e:
         raise Exception(f"Ошибка оптимизации изображения: {str(e)}")
 
+def read_image_meta(image_path, dims_only=False):
+    from PIL import Image
+    # Image.open читает только заголовок файла, пиксели декодируются лишь для цвета и превью
+    with Image.open(image_path) as img:
+        width, height = img.size
+        if dims_only:
+            return {"image_width": width, "image_height": height}
+        img.draft('RGB', (PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4))
+        meta = get_image_meta(img)
+        meta["image_width"], meta["image_height"] = width, height
+        return meta
+
 def parse_front_matter(content):
+    import yaml
     try:
         parts = content.split('---')
         if len(parts) >= 3:
@@ -183,27 +577,36 @@ def parse_front_matter(content):
     except Exception:
         return None, content
 
-def create_news_file_content(user_data, content, image_url=None):
-    date = datetime.now().strftime('%Y-%m-%d')
+def format_image_meta(image_meta):
+    if not image_meta:
+        return ""
+    return "".join(f"{key}: {json.dumps(image_meta[key], ensure_ascii=False)}\n"
+                   for key in IMAGE_META_FIELDS if key in image_meta)
+
+def create_news_file_content(user_data, content, image_url=None, image_meta=None, date=None, news_id=None):
+    date = date or datetime.now().strftime('%Y-%m-%d')
     image_path = f"/{image_url}" if image_url else ""
     
-    news_id = uuid.uuid4().hex[:16]
+    news_id = news_id or uuid.uuid4().hex[:16]
+    # JSON-строка — корректная YAML-строка в двойных кавычках, кавычки и обратные слэши экранируются
+    quote = lambda value: json.dumps(value, ensure_ascii=False)
     
     return f"""---
 layout: news
 news_id: {news_id}
-name: "{user_data['name']}"
-title: "{user_data['title']}"
-description: "{user_data['description']}"
+name: {quote(user_data['name'])}
+title: {quote(user_data['title'])}
+description: {quote(user_data['description'])}
 date: {date}
-image: "{image_path}"
-category: {user_data['category']}
+image: {quote(image_path)}
+{format_image_meta(image_meta if image_url else None)}category: {user_data['category']}
 ---
 
 {content}
 """
 
 def update_news_file_content(old_content, updates):
+    import yaml
     front_matter, body = parse_front_matter(old_content)
     
     if front_matter is None:
@@ -216,85 +619,333 @@ def update_news_file_content(old_content, updates):
         if value is not None:
             front_matter[key] = value
     
-    new_content = "---\n" + yaml.dump(front_matter, allow_unicode=True, sort_keys=False) + "---\n\n" + body
+    new_content = "---\n" + yaml.dump(front_matter, allow_unicode=True, sort_keys=False) + "---\n\n" + body.lstrip('\n')
     return new_content
 
+def backfill_image_meta(dims_only=False):
+    stats = {"updated": 0, "skipped": 0, "failed": 0}
+    fields = IMAGE_META_FIELDS[:2] if dims_only else IMAGE_META_FIELDS
+    for news_file in get_news_files():
+        content = get_news_file_content(news_file)
+        front_matter, _ = parse_front_matter(content or "")
+        if not front_matter or not front_matter.get('image'):
+            stats["skipped"] += 1
+            continue
+        if all(front_matter.get(key) for key in fields):
+            stats["skipped"] += 1
+            continue
+        image_path = LOCAL_REPO_PATH / str(front_matter['image']).lstrip('/')
+        try:
+            image_meta = read_image_meta(image_path, dims_only=dims_only)
+            result = save_news_file(news_file.name, update_news_file_content(content, image_meta))
+            if not result['success']:
+                raise Exception(result['error'])
+            stats["updated"] += 1
+        except Exception as e:
+            print(f"Error backfilling image meta for {news_file.name}: {e}")
+            stats["failed"] += 1
+    return stats
+
+# --- ИМПОРТ И ЭКСПОРТ ---
+@contextmanager
+def open_import_source(source):
+    import tarfile
+    import zipfile
+    source = Path(source)
+    if source.is_dir():
+        yield source
+        return
+    with tempfile.TemporaryDirectory(prefix="privseo_import_") as tmp:
+        if zipfile.is_zipfile(source):
+            with zipfile.ZipFile(source) as archive:
+                archive.extractall(tmp)
+        elif tarfile.is_tarfile(source):
+            with tarfile.open(source) as archive:
+                archive.extractall(tmp, filter='data')
+        else:
+            raise Exception(f"Неподдерживаемый источник импорта: {source}")
+        yield Path(tmp)
+
+def read_import_records(root):
+    import csv
+    import yaml
+    if (root / "metadata.csv").is_file():
+        with open(root / "metadata.csv", 'r', encoding='utf-8-sig', newline='') as f:
+            return list(csv.DictReader(f))
+    for name in ("metadata.yml", "metadata.yaml"):
+        if (root / name).is_file():
+            with open(root / name, 'r', encoding='utf-8') as f:
+                records = yaml.safe_load(f) or []
+            if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+                raise Exception(f"{name}: ожидается список записей вида «- file: ...», а не {type(records).__name__}")
+            return records
+    # Без метаданных все поля берутся из front matter самих markdown-файлов
+    return [{"file": path.relative_to(root).as_posix()} for path in sorted(root.rglob("*.md"))]
+
+def load_import_image(image_bytes):
+    from PIL import Image
+    # WEBP (в том числе экспортированный ботом) не перекодируем, чтобы не терять качество
+    with Image.open(BytesIO(image_bytes)) as img:
+        if img.format == 'WEBP':
+            img.load()
+            return image_bytes, get_image_meta(img)
+    return optimize_image(image_bytes)
+
+def get_existing_news_ids():
+    news_ids = {}
+    for news_file in get_news_files():
+        front_matter, _ = parse_front_matter(get_news_file_content(news_file) or "")
+        if isinstance(front_matter, dict) and front_matter.get('news_id'):
+            news_ids[str(front_matter['news_id'])] = news_file.name
+    return news_ids
+
+def prepare_import_item(root, record):
+    errors = []
+    record = {key: str(value).strip() for key, value in record.items()
+              if key in IMPORT_FIELDS and value not in (None, "")}
+    content = ""
+    root = root.resolve()
+    md_path = (root / record.get("file", "")).resolve()
+    if not md_path.is_relative_to(root):
+        errors.append(f"markdown-файл «{record.get('file', '')}» вне источника импорта")
+    elif record.get("file") and md_path.is_file():
+        text = get_news_file_content(md_path) or ""
+        front_matter, content = parse_front_matter(text) if text.startswith('---') else (None, text)
+        if isinstance(front_matter, dict):
+            # YAML превращает дату в datetime, а в новость она должна попасть так, как записана
+            raw_date = re.search(r'^date:[ \t]*(.+?)[ \t]*$', text.split('---')[1], re.M)
+            if raw_date:
+                front_matter["date"] = raw_date.group(1).strip('"\'')
+            record = {**{key: str(value) for key, value in front_matter.items()
+                         if key in IMPORT_FIELDS and value not in (None, "")}, **record}
+        content = content.strip('\n')
+    else:
+        errors.append(f"не найден markdown-файл «{record.get('file', '')}»")
+
+    for key in ("name", "title", "description"):
+        if not record.get(key):
+            errors.append(f"не заполнено поле {key}")
+    if not content:
+        errors.append("пустой текст новости")
+
+    category = record.get("category", "")
+    category = next((k for k, v in CATEGORIES.items() if v == category), category)
+    if category not in CATEGORIES:
+        errors.append(f"неизвестная категория «{category}»")
+
+    # Допускается и дата со временем, например «2025-02-02 10:00:00 +0300»; в имена файлов идёт только день
+    date = record.get("date") or datetime.now().strftime('%Y-%m-%d')
+    day = date[:10]
+    try:
+        datetime.strptime(day, '%Y-%m-%d')
+        if not IMPORT_DATE_PATTERN.fullmatch(date):
+            raise ValueError(date)
+    except ValueError:
+        errors.append(f"неверная дата «{date}», ожидается ГГГГ-ММ-ДД или ГГГГ-ММ-ДД ЧЧ:ММ:СС")
+
+    news_id = record.get("news_id") or uuid.uuid4().hex[:16]
+    image_name = f"{day.replace('-', '')}_{news_id}.webp"
+    image_bytes, image_meta, image_url = None, None, None
+    if record.get("image"):
+        image_path = (root / record["image"].lstrip('/')).resolve()
+        try:
+            if not image_path.is_relative_to(root):
+                raise Exception("файл вне источника импорта")
+            with open(image_path, 'rb') as f:
+                image_bytes, image_meta = load_import_image(f.read())
+            image_url = f"{IMAGES_DIR}/{image_name}"
+        except Exception as e:
+            errors.append(f"изображение «{record['image']}»: {e}")
+
+    user_data = {
+        "name": record.get("name", ""),
+        "title": record.get("title", ""),
+        "description": record.get("description", ""),
+        "category": category
+    }
+    news_content = create_news_file_content(user_data, content, image_url, image_meta, date=date, news_id=news_id)
+    front_matter, _ = parse_front_matter(news_content)
+    expected = {"name": user_data["name"], "title": user_data["title"],
+                "description": user_data["description"], "news_id": news_id}
+    if not isinstance(front_matter, dict) or any(str(front_matter.get(k)) != v for k, v in expected.items()):
+        errors.append("поля ломают front matter (проверьте кавычки и спецсимволы)")
+
+    # Имя экспортированного файла сохраняем, иначе переименованная новость импортируется дублем
+    filename = Path(record.get("file", "")).name
+    if not IMPORT_FILENAME_PATTERN.fullmatch(filename):
+        filename = f"{day}-{transliterate(user_data['name'])}.md"
+
+    return {
+        "source": record.get("file", ""),
+        "filename": filename,
+        "news_id": news_id,
+        "content": news_content,
+        "image_name": image_name,
+        "image": image_bytes,
+        "errors": errors
+    }
+
+def write_import_item(item):
+    if item["image"] is not None and not save_image(item["image"], item["image_name"]):
+        return False
+    return save_news_file(item["filename"], item["content"])["success"]
+
+def import_news(source, workers=None, dry_run=False, skip_invalid=False, overwrite=False):
+    from concurrent.futures import ThreadPoolExecutor
+    with open_import_source(source) as root:
+        records = read_import_records(root)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            items = list(executor.map(lambda record: prepare_import_item(root, record), records))
+
+    existing = {path.name for path in get_news_files()}
+    existing_ids = get_existing_news_ids()
+    seen, seen_ids = set(), set()
+    for item in items:
+        if item["filename"] in seen:
+            item["errors"].append(f"дублирующееся имя файла {item['filename']}")
+        elif item["filename"] in existing and not overwrite:
+            item["errors"].append(f"новость {item['filename']} уже существует")
+        seen.add(item["filename"])
+        # От news_id зависит имя изображения, поэтому он тоже должен быть уникальным
+        if item["news_id"] in seen_ids:
+            item["errors"].append(f"дублирующийся news_id {item['news_id']}")
+        elif item["news_id"] in existing_ids and not (overwrite and existing_ids[item["news_id"]] == item["filename"]):
+            item["errors"].append(f"news_id {item['news_id']} уже есть у {existing_ids[item['news_id']]}")
+        seen_ids.add(item["news_id"])
+
+    invalid = [item for item in items if item["errors"]]
+    for item in invalid:
+        print(f"❌ {item['source']}: {'; '.join(item['errors'])}")
+    stats = {"valid": len(items) - len(invalid), "imported": 0, "invalid": len(invalid), "failed": 0}
+    # Пока есть ошибки, ничего не записываем, если явно не разрешено пропускать
+    if dry_run or (invalid and not skip_invalid):
+        return stats
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for success in executor.map(write_import_item, [item for item in items if not item["errors"]]):
+            stats["imported" if success else "failed"] += 1
+    return stats
+
+def export_news_item(news_file, out_dir):
+    front_matter, body = parse_front_matter(get_news_file_content(news_file) or "")
+    if not isinstance(front_matter, dict):
+        print(f"Error exporting {news_file.name}: не удалось разобрать front matter")
+        return None
+    record = {key: str(front_matter.get(key) or "") for key in IMPORT_FIELDS}
+    record["file"] = f"posts/{news_file.name}"
+    with open(out_dir / record["file"], 'w', encoding='utf-8') as f:
+        f.write(body.strip('\n') + "\n")
+    if record["image"]:
+        image_path = LOCAL_REPO_PATH / record["image"].lstrip('/')
+        if image_path.is_file():
+            shutil.copyfile(image_path, out_dir / "images" / image_path.name)
+            record["image"] = f"images/{image_path.name}"
+        else:
+            print(f"Error exporting {news_file.name}: нет изображения {record['image']}")
+            record["image"] = ""
+    return record
+
+def export_news(target, fmt="csv", workers=None):
+    import csv
+    from concurrent.futures import ThreadPoolExecutor
+    import yaml
+    target = Path(target)
+    as_zip = target.suffix == ".zip"
+    out_dir = Path(tempfile.mkdtemp(prefix="privseo_export_")) if as_zip else target
+    (out_dir / "posts").mkdir(parents=True, exist_ok=True)
+    (out_dir / "images").mkdir(parents=True, exist_ok=True)
+
+    news_files = sorted(get_news_files())
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        records = [r for r in executor.map(lambda path: export_news_item(path, out_dir), news_files) if r]
+
+    if fmt == "yaml":
+        with open(out_dir / "metadata.yml", 'w', encoding='utf-8') as f:
+            yaml.dump(records, f, allow_unicode=True, sort_keys=False)
+    else:
+        with open(out_dir / "metadata.csv", 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=IMPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+
+    if as_zip:
+        shutil.make_archive(str(target.with_suffix('')), 'zip', out_dir)
+        shutil.rmtree(out_dir, ignore_errors=True)
+    return {"exported": len(records), "failed": len(news_files) - len(records)}
+
 # --- ОБРАБОТЧИКИ КОМАНД ---
-@bot.message_handler(commands=['start', 'help'])
 def send_welcome(message):
     if is_authorized(message.from_user.id):
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
             "🌐 Управление сайтом\n\n"
             "/news - Управление новостями\n"
             "/menu - Управление меню\n"
+            "/stats - Статистика производительности\n"
             "/help - Справка"
         )
     else:
-        bot.reply_to(message, "⛔ Доступ запрещен")
+        outbox.reply_to(message, "⛔ Доступ запрещен")
 
-@bot.message_handler(commands=['menu'])
 def manage_menu(message):
     if not is_authorized(message.from_user.id):
         return
-    bot.send_message(message.chat.id, "🔧 Управление меню сайта:", reply_markup=menu_keyboard())
+    outbox.send_message(message.chat.id, "🔧 Управление меню сайта:", reply_markup=menu_keyboard())
 
-@bot.message_handler(commands=['news'])
 def manage_news(message):
     if not is_authorized(message.from_user.id):
         return
-    bot.send_message(message.chat.id, "📰 Управление новостями:", reply_markup=news_management_keyboard())
+    outbox.send_message(message.chat.id, "📰 Управление новостями:", reply_markup=news_management_keyboard())
+
+def show_stats(message):
+    if not is_authorized(message.from_user.id):
+        return
+    outbox.send_message(message.chat.id, metrics.summary())
 
 # --- ОБРАБОТЧИКИ СООБЩЕНИЙ ---
-@bot.message_handler(func=lambda m: user_states.get(m.chat.id, {}).get('step') == 'waiting_for_category' and m.text in CATEGORIES.values())
 def process_category(message):
+    from telebot.types import ReplyKeyboardRemove
     category = next(k for k, v in CATEGORIES.items() if v == message.text)
     user_states[message.chat.id] = {
         'step': 'waiting_for_name',
         'category': category,
         'media': None
     }
-    bot.send_message(message.chat.id, "📝 Введите название новости (для отображения на сайте):", reply_markup=ReplyKeyboardRemove())
+    outbox.send_message(message.chat.id, "📝 Введите название новости (для отображения на сайте):", reply_markup=ReplyKeyboardRemove())
 
-@bot.message_handler(func=lambda m: user_states.get(m.chat.id, {}).get('step') == 'waiting_for_name')
 def process_name(message):
     user_states[message.chat.id]['name'] = message.text
     user_states[message.chat.id]['step'] = 'waiting_for_title'
-    bot.send_message(message.chat.id, "🏷 Введите title (для SEO заголовка):")
+    outbox.send_message(message.chat.id, "🏷 Введите title (для SEO заголовка):")
 
-@bot.message_handler(func=lambda m: user_states.get(m.chat.id, {}).get('step') == 'waiting_for_title')
 def process_title(message):
     user_states[message.chat.id]['title'] = message.text
     user_states[message.chat.id]['step'] = 'waiting_for_description'
-    bot.send_message(message.chat.id, "📄 Введите описание новости:")
+    outbox.send_message(message.chat.id, "📄 Введите описание новости:")
 
-@bot.message_handler(func=lambda m: user_states.get(m.chat.id, {}).get('step') == 'waiting_for_description')
 def process_description(message):
     user_states[message.chat.id]['description'] = message.text
     user_states[message.chat.id]['step'] = 'waiting_for_media'
-    bot.send_message(message.chat.id, "🖼 Отправьте изображение для новости (или /skip чтобы пропустить):")
+    outbox.send_message(message.chat.id, "🖼 Отправьте изображение для новости (или /skip чтобы пропустить):")
 
-@bot.message_handler(commands=['skip'], func=lambda m: user_states.get(m.chat.id, {}).get('step') == 'waiting_for_media')
 def skip_media(message):
     user_states[message.chat.id]['step'] = 'waiting_for_content'
-    bot.send_message(message.chat.id, "💬 Введите основной текст новости (HTML/Markdown):")
+    outbox.send_message(message.chat.id, "💬 Введите основной текст новости (HTML/Markdown):")
 
-@bot.message_handler(content_types=['photo'], func=lambda m: user_states.get(m.chat.id, {}).get('step') == 'waiting_for_media')
 def process_media(message):
     try:
-        file_info = bot.get_file(message.photo[-1].file_id)
-        original_image = bot.download_file(file_info.file_path)
+        original_image = download_photo(message.photo[-1].file_id)
         
-        bot.send_chat_action(message.chat.id, 'upload_photo')
-        optimized_image = optimize_image(original_image)
+        outbox.send_chat_action(message.chat.id, 'upload_photo')
+        optimized_image, image_meta = optimize_image(original_image)
         
         user_states[message.chat.id]['media'] = optimized_image
+        user_states[message.chat.id]['media_meta'] = image_meta
         user_states[message.chat.id]['step'] = 'waiting_for_content'
-        bot.send_message(message.chat.id, "✅ Изображение оптимизировано и готово к загрузке! Теперь введите основной текст:")
+        outbox.send_message(message.chat.id, "✅ Изображение оптимизировано и готово к загрузке! Теперь введите основной текст:")
     except Exception as e:
-        bot.reply_to(message, f"❌ Ошибка обработки изображения: {str(e)}")
+        reply_error(message.chat.id, f"❌ Ошибка обработки изображения: {str(e)}", reply_to_message_id=message.message_id)
 
-@bot.message_handler(func=lambda m: user_states.get(m.chat.id, {}).get('step') == 'waiting_for_content')
 def process_content(message):
     try:
         user_data = user_states[message.chat.id]
@@ -309,11 +960,11 @@ def process_content(message):
 
         transliterated_name = transliterate(user_data['name'])
         filename = f"{datetime.now().strftime('%Y-%m-%d')}-{transliterated_name}.md"
-        content = create_news_file_content(user_data, message.text, image_url)
+        content = create_news_file_content(user_data, message.text, image_url, user_data.get('media_meta'))
 
         result = save_news_file(filename, content)
         if result['success']:
-            bot.send_message(
+            outbox.send_message(
                 message.chat.id,
                 f"""✅ Новость успешно добавлена!
                 
@@ -327,67 +978,64 @@ def process_content(message):
             raise Exception(result.get('error', 'Неизвестная ошибка'))
     
     except Exception as e:
-        bot.send_message(message.chat.id, f"❌ Ошибка при сохранении новости: {str(e)}")
+        reply_error(message.chat.id, f"❌ Ошибка при сохранении новости: {str(e)}")
     finally:
         if message.chat.id in user_states:
             del user_states[message.chat.id]
 
 # --- ОБРАБОТЧИКИ INLINE КНОПОК ---
-@bot.callback_query_handler(func=lambda call: call.data == "show_menu")
 def show_menu(call):
     try:
         menu = get_menu_data()
         text = "📋 Текущее меню:\n\n"
         for i, item in enumerate(menu['items'], 1):
             text += f"{i}. {item['title']} → {item['url']}\n"
-        bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=menu_keyboard())
+        outbox.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=menu_keyboard())
     except Exception as e:
-        bot.send_message(call.message.chat.id, f"❌ Ошибка при получении меню: {str(e)}")
+        reply_error(call.message.chat.id, f"❌ Ошибка при получении меню: {str(e)}")
 
-@bot.callback_query_handler(func=lambda call: call.data == "add_item")
 def add_item_start(call):
     user_states[call.message.chat.id] = {"action": "add_item", "step": "title"}
-    bot.edit_message_text(
+    outbox.edit_message_text(
         "Введите название нового пункта меню:",
         call.message.chat.id,
         call.message.message_id
     )
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("edit_item"))
 def edit_item_start(call):
+    from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
     try:
         menu = get_menu_data()
         markup = InlineKeyboardMarkup()
         for i, item in enumerate(menu['items']):
             markup.add(InlineKeyboardButton(f"{i+1}. {item['title']}", callback_data=f"edit_select_{i}"))
         markup.add(InlineKeyboardButton("🔙 Назад", callback_data="back_to_menu"))
-        bot.edit_message_text(
+        outbox.edit_message_text(
             "Выберите пункт для редактирования:",
             call.message.chat.id,
             call.message.message_id,
             reply_markup=markup
         )
     except Exception as e:
-        bot.send_message(call.message.chat.id, f"❌ Ошибка при редактировании меню: {str(e)}")
+        reply_error(call.message.chat.id, f"❌ Ошибка при редактировании меню: {str(e)}")
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("delete_item"))
 def delete_item_start(call):
+    from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
     try:
         menu = get_menu_data()
         markup = InlineKeyboardMarkup()
         for i, item in enumerate(menu['items']):
             markup.add(InlineKeyboardButton(f"{i+1}. {item['title']}", callback_data=f"delete_confirm_{i}"))
         markup.add(InlineKeyboardButton("🔙 Назад", callback_data="back_to_menu"))
-        bot.edit_message_text(
+        outbox.edit_message_text(
             "Выберите пункт для удаления:",
             call.message.chat.id,
             call.message.message_id,
             reply_markup=markup
         )
     except Exception as e:
-        bot.send_message(call.message.chat.id, f"❌ Ошибка при удалении пункта: {str(e)}")
+        reply_error(call.message.chat.id, f"❌ Ошибка при удалении пункта: {str(e)}")
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("edit_select_"))
 def edit_item_select(call):
     try:
         index = int(call.data.split("_")[2])
@@ -400,16 +1048,16 @@ def edit_item_select(call):
             "step": "title"
         }
         
-        bot.edit_message_text(
+        outbox.edit_message_text(
             f"Редактирование пункта меню:\n\nТекущее название: {item['title']}\nТекущий URL: {item['url']}\n\nВведите новое название (или /skip чтобы оставить текущее):",
             call.message.chat.id,
             call.message.message_id
         )
     except Exception as e:
-        bot.send_message(call.message.chat.id, f"❌ Ошибка при выборе пункта: {str(e)}")
+        reply_error(call.message.chat.id, f"❌ Ошибка при выборе пункта: {str(e)}")
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("delete_confirm_"))
 def delete_item_confirm(call):
+    from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
     try:
         index = int(call.data.split("_")[2])
         menu = get_menu_data()
@@ -421,16 +1069,15 @@ def delete_item_confirm(call):
             InlineKeyboardButton("❌ Нет, отмена", callback_data="back_to_menu")
         )
         
-        bot.edit_message_text(
+        outbox.edit_message_text(
             f"Вы уверены, что хотите удалить пункт меню?\n\n{item['title']} → {item['url']}",
             call.message.chat.id,
             call.message.message_id,
             reply_markup=markup
         )
     except Exception as e:
-        bot.send_message(call.message.chat.id, f"❌ Ошибка при подтверждении удаления: {str(e)}")
+        reply_error(call.message.chat.id, f"❌ Ошибка при подтверждении удаления: {str(e)}")
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("delete_execute_"))
 def delete_item_execute(call):
     try:
         index = int(call.data.split("_")[2])
@@ -440,7 +1087,7 @@ def delete_item_execute(call):
         del menu['items'][index]
         
         if update_menu_data(menu):
-            bot.edit_message_text(
+            outbox.edit_message_text(
                 f"✅ Пункт меню удален: {item['title']}",
                 call.message.chat.id,
                 call.message.message_id,
@@ -449,18 +1096,16 @@ def delete_item_execute(call):
         else:
             raise Exception("Не удалось обновить меню")
     except Exception as e:
-        bot.send_message(call.message.chat.id, f"❌ Ошибка при удалении пункта: {str(e)}")
+        reply_error(call.message.chat.id, f"❌ Ошибка при удалении пункта: {str(e)}")
 
-@bot.callback_query_handler(func=lambda call: call.data == "add_news")
 def add_news_start(call):
     if not is_authorized(call.from_user.id):
         return
     
-    bot.send_message(call.message.chat.id, "Выберите категорию:", reply_markup=category_keyboard())
+    outbox.send_message(call.message.chat.id, "Выберите категорию:", reply_markup=category_keyboard())
     user_states[call.message.chat.id] = {'step': 'waiting_for_category'}
     bot.answer_callback_query(call.id)
 
-@bot.callback_query_handler(func=lambda call: call.data == "list_news")
 def list_news(call):
     try:
         news_files = get_news_files()
@@ -471,17 +1116,17 @@ def list_news(call):
         for i, news in enumerate(news_files[:10], 1):
             text += f"{i}. {news.name.replace('.md', '')}\n"
         
-        bot.edit_message_text(
+        outbox.edit_message_text(
             text,
             call.message.chat.id,
             call.message.message_id,
             reply_markup=news_management_keyboard()
         )
     except Exception as e:
-        bot.send_message(call.message.chat.id, f"❌ Ошибка при получении списка новостей: {str(e)}")
+        reply_error(call.message.chat.id, f"❌ Ошибка при получении списка новостей: {str(e)}")
 
-@bot.callback_query_handler(func=lambda call: call.data == "edit_news")
 def edit_news_start(call):
+    from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
     try:
         news_files = get_news_files()
         if not news_files:
@@ -492,17 +1137,17 @@ def edit_news_start(call):
             markup.add(InlineKeyboardButton(f"{i+1}. {news.name.replace('.md', '')}", callback_data=f"edit_news_select_{i}"))
         markup.add(InlineKeyboardButton("🔙 Назад", callback_data="back_to_news"))
         
-        bot.edit_message_text(
+        outbox.edit_message_text(
             "Выберите новость для редактирования:",
             call.message.chat.id,
             call.message.message_id,
             reply_markup=markup
         )
     except Exception as e:
-        bot.send_message(call.message.chat.id, f"❌ Ошибка при выборе новости: {str(e)}")
+        reply_error(call.message.chat.id, f"❌ Ошибка при выборе новости: {str(e)}")
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("edit_news_select_"))
 def edit_news_select(call):
+    from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
     try:
         index = int(call.data.split("_")[3])
         news_files = get_news_files()
@@ -540,7 +1185,7 @@ def edit_news_select(call):
         )
         markup.add(InlineKeyboardButton("🔙 Назад", callback_data="back_to_news"))
         
-        bot.edit_message_text(
+        outbox.edit_message_text(
             f"Выберите поле для редактирования:\n\nТекущие данные:\n"
             f"Название: {front_matter.get('name', 'нет')}\n"
             f"Title: {front_matter.get('title', 'нет')}\n"
@@ -551,9 +1196,8 @@ def edit_news_select(call):
             reply_markup=markup
         )
     except Exception as e:
-        bot.send_message(call.message.chat.id, f"❌ Ошибка при выборе новости: {str(e)}")
+        reply_error(call.message.chat.id, f"❌ Ошибка при выборе новости: {str(e)}")
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("edit_field_"))
 def edit_news_field(call):
     field = call.data.split("_")[2]
     user_data = user_states.get(call.message.chat.id, {})
@@ -565,9 +1209,9 @@ def edit_news_field(call):
     user_data["step"] = "waiting_edit_value"
     
     if field == "category":
-        bot.send_message(call.message.chat.id, "Выберите новую категорию:", reply_markup=category_keyboard())
+        outbox.send_message(call.message.chat.id, "Выберите новую категорию:", reply_markup=category_keyboard())
     elif field == "image":
-        bot.send_message(call.message.chat.id, "Отправьте новое изображение (или /skip чтобы оставить текущее):")
+        outbox.send_message(call.message.chat.id, "Отправьте новое изображение (или /skip чтобы оставить текущее):")
     else:
         prompt = {
             "name": "Введите новое название новости:",
@@ -576,12 +1220,12 @@ def edit_news_field(call):
             "content": "Введите новый контент:"
         }.get(field, "Введите новое значение:")
         
-        bot.send_message(call.message.chat.id, prompt)
+        outbox.send_message(call.message.chat.id, prompt)
     
     bot.answer_callback_query(call.id)
 
-@bot.message_handler(func=lambda m: user_states.get(m.chat.id, {}).get('step') == 'waiting_edit_value')
 def process_news_edit(message):
+    import yaml
     try:
         user_data = user_states[message.chat.id]
         field = user_data["edit_field"]
@@ -595,15 +1239,16 @@ def process_news_edit(message):
                 raise Exception("Неверная категория")
         elif field == "image":
             if message.photo:
-                file_info = bot.get_file(message.photo[-1].file_id)
-                original_image = bot.download_file(file_info.file_path)
-                optimized_image = optimize_image(original_image)
+                original_image = download_photo(message.photo[-1].file_id)
+                optimized_image, image_meta = optimize_image(original_image)
                 
                 image_name = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.webp"
                 saved_image_path = save_image(optimized_image, image_name)
                 
                 if saved_image_path:
-                    updates["image"] = f"/{saved_image_path.replace('\\', '/')}"
+                    image_url = saved_image_path.replace('\\', '/')
+                    updates["image"] = f"/{image_url}"
+                    updates.update(image_meta)
             elif message.text != "/skip":
                 raise Exception("Пожалуйста, отправьте изображение или используйте /skip")
         else:
@@ -617,16 +1262,14 @@ def process_news_edit(message):
                 front_matter, _ = parse_front_matter(user_data["current_content"])
                 new_content = f"---\n{yaml.dump(front_matter, allow_unicode=True, sort_keys=False)}---\n\n{message.text}"
                 
-                try:
-                    with open(user_data["news_path"], 'w', encoding='utf-8') as f:
-                        f.write(new_content)
-                    bot.send_message(
-                        message.chat.id,
-                        f"✅ Контент новости успешно обновлен!\n"
-                        f"📁 Путь: {user_data['news_path']}"
-                    )
-                except Exception as e:
-                    raise Exception(f"Не удалось обновить контент: {str(e)}")
+                result = save_news_file(Path(user_data["news_path"]).name, new_content)
+                if not result['success']:
+                    raise Exception(f"Не удалось обновить контент: {result['error']}")
+                outbox.send_message(
+                    message.chat.id,
+                    f"✅ Контент новости успешно обновлен!\n"
+                    f"📁 Путь: {user_data['news_path']}"
+                )
                 
                 del user_states[message.chat.id]
                 return
@@ -634,26 +1277,24 @@ def process_news_edit(message):
         if field != "content":
             new_content = update_news_file_content(user_data["current_content"], updates)
             
-            try:
-                with open(user_data["news_path"], 'w', encoding='utf-8') as f:
-                    f.write(new_content)
-                bot.send_message(
-                    message.chat.id,
-                    f"✅ Новость успешно обновлена!\n"
-                    f"📁 Путь: {user_data['news_path']}"
-                )
-            except Exception as e:
-                raise Exception(f"Не удалось обновить новость: {str(e)}")
+            result = save_news_file(Path(user_data["news_path"]).name, new_content)
+            if not result['success']:
+                raise Exception(f"Не удалось обновить новость: {result['error']}")
+            outbox.send_message(
+                message.chat.id,
+                f"✅ Новость успешно обновлена!\n"
+                f"📁 Путь: {user_data['news_path']}"
+            )
         
         del user_states[message.chat.id]
     
     except Exception as e:
-        bot.send_message(message.chat.id, f"❌ Ошибка при обновлении новости: {str(e)}")
+        reply_error(message.chat.id, f"❌ Ошибка при обновлении новости: {str(e)}")
         if message.chat.id in user_states:
             del user_states[message.chat.id]
 
-@bot.callback_query_handler(func=lambda call: call.data == "delete_news")
 def delete_news_start(call):
+    from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
     try:
         news_files = get_news_files()
         if not news_files:
@@ -664,17 +1305,17 @@ def delete_news_start(call):
             markup.add(InlineKeyboardButton(f"{i+1}. {news.name.replace('.md', '')}", callback_data=f"delete_news_confirm_{i}"))
         markup.add(InlineKeyboardButton("🔙 Назад", callback_data="back_to_news"))
         
-        bot.edit_message_text(
+        outbox.edit_message_text(
             "Выберите новость для удаления:",
             call.message.chat.id,
             call.message.message_id,
             reply_markup=markup
         )
     except Exception as e:
-        bot.send_message(call.message.chat.id, f"❌ Ошибка при выборе новости: {str(e)}")
+        reply_error(call.message.chat.id, f"❌ Ошибка при выборе новости: {str(e)}")
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("delete_news_confirm_"))
 def delete_news_confirm(call):
+    from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
     try:
         index = int(call.data.split("_")[3])
         news_files = get_news_files()
@@ -690,16 +1331,15 @@ def delete_news_confirm(call):
             InlineKeyboardButton("❌ Нет, отмена", callback_data="back_to_news")
         )
         
-        bot.edit_message_text(
+        outbox.edit_message_text(
             f"Вы уверены, что хотите удалить новость?\n\n{front_matter.get('name', 'Без названия')}",
             call.message.chat.id,
             call.message.message_id,
             reply_markup=markup
         )
     except Exception as e:
-        bot.send_message(call.message.chat.id, f"❌ Ошибка при подтверждении удаления: {str(e)}")
+        reply_error(call.message.chat.id, f"❌ Ошибка при подтверждении удаления: {str(e)}")
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("delete_news_execute_"))
 def delete_news_execute(call):
     try:
         index = int(call.data.split("_")[3])
@@ -710,7 +1350,7 @@ def delete_news_execute(call):
         news_file = news_files[index]
         
         if delete_news_file(news_file.name):
-            bot.edit_message_text(
+            outbox.edit_message_text(
                 f"✅ Новость успешно удалена: {news_file.name}",
                 call.message.chat.id,
                 call.message.message_id,
@@ -720,40 +1360,34 @@ def delete_news_execute(call):
             raise Exception("Не удалось удалить файл новости")
     
     except Exception as e:
-        bot.send_message(call.message.chat.id, f"❌ Ошибка при удалении новости: {str(e)}")
+        reply_error(call.message.chat.id, f"❌ Ошибка при удалении новости: {str(e)}")
 
-@bot.callback_query_handler(func=lambda call: call.data == "back_to_news")
 def back_to_news(call):
-    bot.edit_message_text(
+    outbox.edit_message_text(
         "📰 Управление новостями:",
         call.message.chat.id,
         call.message.message_id,
         reply_markup=news_management_keyboard()
     )
 
-@bot.callback_query_handler(func=lambda call: call.data == "back_to_menu")
 def back_to_menu(call):
-    bot.edit_message_text(
+    outbox.edit_message_text(
         "🔧 Управление меню сайта:",
         call.message.chat.id,
         call.message.message_id,
         reply_markup=menu_keyboard()
     )
 
-@bot.message_handler(func=lambda m: user_states.get(m.chat.id, {}).get('action') in ('add_item', 'edit_item') and 
-                                  user_states[m.chat.id]['step'] == 'title')
 def process_menu_item_title(message):
     try:
         user_data = user_states[message.chat.id]
         if message.text != '/skip':
             user_data['title'] = message.text
         user_data['step'] = 'url'
-        bot.send_message(message.chat.id, "🌐 Введите URL для пункта меню:")
+        outbox.send_message(message.chat.id, "🌐 Введите URL для пункта меню:")
     except Exception as e:
-        bot.send_message(message.chat.id, f"❌ Ошибка обработки названия: {str(e)}")
+        reply_error(message.chat.id, f"❌ Ошибка обработки названия: {str(e)}")
 
-@bot.message_handler(func=lambda m: user_states.get(m.chat.id, {}).get('action') in ('add_item', 'edit_item') and 
-                                  user_states[m.chat.id]['step'] == 'url')
 def process_menu_item_url(message):
     try:
         user_data = user_states[message.chat.id]
@@ -773,15 +1407,140 @@ def process_menu_item_url(message):
             success_msg = "✅ Пункт меню обновлен!"
         
         if update_menu_data(menu):
-            bot.send_message(message.chat.id, success_msg, reply_markup=menu_keyboard())
+            outbox.send_message(message.chat.id, success_msg, reply_markup=menu_keyboard())
         else:
-            bot.send_message(message.chat.id, "❌ Ошибка при сохранении меню")
+            reply_error(message.chat.id, "❌ Ошибка при сохранении меню")
         
         del user_states[message.chat.id]
     except Exception as e:
-        bot.send_message(message.chat.id, f"❌ Ошибка обработки URL: {str(e)}")
+        reply_error(message.chat.id, f"❌ Ошибка обработки URL: {str(e)}")
+
+# --- РЕГИСТРАЦИЯ ОБРАБОТЧИКОВ ---
+def in_step(step):
+    return lambda m: user_states.get(m.chat.id, {}).get('step') == step
+
+def in_menu_step(step):
+    return lambda m: (user_states.get(m.chat.id, {}).get('action') in ('add_item', 'edit_item') and
+                      user_states[m.chat.id]['step'] == step)
+
+def data_equals(data):
+    return lambda call: call.data == data
+
+def data_startswith(prefix):
+    return lambda call: call.data.startswith(prefix)
+
+# Порядок важен: telebot вызывает первый подходящий обработчик
+MESSAGE_HANDLERS = (
+    (send_welcome, {"commands": ['start', 'help']}),
+    (manage_menu, {"commands": ['menu']}),
+    (manage_news, {"commands": ['news']}),
+    (show_stats, {"commands": ['stats']}),
+    (process_category, {"func": lambda m: in_step('waiting_for_category')(m) and m.text in CATEGORIES.values()}),
+    (process_name, {"func": in_step('waiting_for_name')}),
+    (process_title, {"func": in_step('waiting_for_title')}),
+    (process_description, {"func": in_step('waiting_for_description')}),
+    (skip_media, {"commands": ['skip'], "func": in_step('waiting_for_media')}),
+    (process_media, {"content_types": ['photo'], "func": in_step('waiting_for_media')}),
+    (process_content, {"func": in_step('waiting_for_content')}),
+    (process_news_edit, {"content_types": ['text', 'photo'], "func": in_step('waiting_edit_value')}),
+    (process_menu_item_title, {"func": in_menu_step('title')}),
+    (process_menu_item_url, {"func": in_menu_step('url')}),
+)
+
+CALLBACK_HANDLERS = (
+    (show_menu, data_equals("show_menu")),
+    (add_item_start, data_equals("add_item")),
+    (edit_item_start, data_startswith("edit_item")),
+    (delete_item_start, data_startswith("delete_item")),
+    (edit_item_select, data_startswith("edit_select_")),
+    (delete_item_confirm, data_startswith("delete_confirm_")),
+    (delete_item_execute, data_startswith("delete_execute_")),
+    (add_news_start, data_equals("add_news")),
+    (list_news, data_equals("list_news")),
+    (edit_news_start, data_equals("edit_news")),
+    (edit_news_select, data_startswith("edit_news_select_")),
+    (edit_news_field, data_startswith("edit_field_")),
+    (delete_news_start, data_equals("delete_news")),
+    (delete_news_confirm, data_startswith("delete_news_confirm_")),
+    (delete_news_execute, data_startswith("delete_news_execute_")),
+    (back_to_news, data_equals("back_to_news")),
+    (back_to_menu, data_equals("back_to_menu")),
+)
+
+def create_bot(token=None):
+    global bot, outbox
+    import telebot
+
+    bot = telebot.TeleBot(token or BOT_TOKEN)
+    outbox = OutboundQueue(bot)
+    for handler, filters in MESSAGE_HANDLERS:
+        bot.register_message_handler(timed()(handler), **filters)
+    for handler, func in CALLBACK_HANDLERS:
+        bot.register_callback_query_handler(timed()(handler), func=func)
+    return bot
+
+def report_first_poll(bot):
+    get_updates = bot.get_updates
+
+    def first_get_updates(*args, **kwargs):
+        bot.get_updates = get_updates
+        startup_time = time.perf_counter() - START_TIME
+        metrics.observe("startup.first_poll", startup_time)
+        print(f"🟢 Бот запущен за {startup_time * 1000:.0f} мс! Ожидание сообщений...")
+        return get_updates(*args, **kwargs)
+
+    bot.get_updates = first_get_updates
 
 # --- ЗАПУСК БОТА ---
 if __name__ == "__main__":
-    print("🟢 Бот запущен! Ожидание сообщений...")
-    bot.infinity_polling()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Telegram-бот управления сайтом")
+    subparsers = parser.add_subparsers(dest="command")
+    backfill_parser = subparsers.add_parser("backfill-images", help="Дописать размеры, цвет и превью изображений в существующие новости")
+    backfill_parser.add_argument("--dims-only", action="store_true", help="Только размеры (чтение заголовков файлов)")
+    import_parser = subparsers.add_parser("import", help="Импортировать новости из папки или архива (markdown + изображения + metadata.csv/yml)")
+    import_parser.add_argument("source", help="Папка, .zip или .tar.gz")
+    import_parser.add_argument("--workers", type=int, help="Количество параллельных потоков")
+    import_parser.add_argument("--dry-run", action="store_true", help="Только проверить, ничего не записывая")
+    import_parser.add_argument("--skip-invalid", action="store_true", help="Записать корректные новости, пропустив ошибочные")
+    import_parser.add_argument("--overwrite", action="store_true", help="Перезаписывать существующие новости")
+    export_parser = subparsers.add_parser("export", help="Экспортировать новости в папку или .zip")
+    export_parser.add_argument("target", help="Папка или путь к .zip")
+    export_parser.add_argument("--format", choices=("csv", "yaml"), default="csv", help="Формат файла метаданных")
+    export_parser.add_argument("--workers", type=int, help="Количество параллельных потоков")
+    args = parser.parse_args()
+    load_settings()
+
+    if args.command == "backfill-images":
+        stats = backfill_image_meta(dims_only=args.dims_only)
+        print(f"✅ Обновлено: {stats['updated']}, пропущено: {stats['skipped']}, ошибок: {stats['failed']}")
+    elif args.command == "import":
+        try:
+            stats = import_news(args.source, workers=args.workers, dry_run=args.dry_run,
+                                skip_invalid=args.skip_invalid, overwrite=args.overwrite)
+        except Exception as e:
+            sys.exit(f"❌ Ошибка импорта: {e}")
+        if args.dry_run:
+            print(f"✅ Проверено без ошибок: {stats['valid']}, с ошибками: {stats['invalid']}")
+        else:
+            print(f"✅ Импортировано: {stats['imported']}, с ошибками: {stats['invalid']}, не записано: {stats['failed']}")
+        if stats["invalid"] or stats["failed"]:
+            sys.exit(1)
+    elif args.command == "export":
+        stats = export_news(args.target, fmt=args.format, workers=args.workers)
+        print(f"✅ Экспортировано: {stats['exported']}, ошибок: {stats['failed']}")
+    else:
+        if METRICS_PORT:
+            start_metrics_server(METRICS_PORT)
+            print(f"📊 Метрики Prometheus: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        if not BOT_TOKEN or AUTHORIZED_USER_ID is None:
+            sys.exit("❌ Не заданы BOT_TOKEN и/или AUTHORIZED_USER_ID (переменные окружения или .env)")
+        create_bot()
+        report_first_poll(bot)
+        # SIGTERM от супервизора останавливает опрос так же, как Ctrl+C, чтобы успеть отправить очередь
+        signal.signal(signal.SIGTERM, lambda signum, frame: bot.stop_polling())
+        try:
+            bot.infinity_polling()
+        finally:
+            if not outbox.flush(timeout=OUTBOX_SHUTDOWN_TIMEOUT):
+                print(f"Error flushing outbound queue: not drained within {OUTBOX_SHUTDOWN_TIMEOUT}s")
+            print("🔴 Бот остановлен")
\ No newline at end of file